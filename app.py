@@ -1,14 +1,17 @@
 import streamlit as st
-import json, os, math, random, hashlib, datetime, urllib.parse, time
+import json, os, math, random, hashlib, datetime, urllib.parse, time, contextlib
 import pandas as pd
 from streamlit_cookies_manager import EncryptedCookieManager
 from supabase import create_client, Client
+from coordination import SupabaseCoordinator, SupabaseDraftsStore, VersionedCache, LeaseBusy, WriteConflict
+from draft_model import drafts_from_dict, drafts_to_dict
 import os
 
 # -------- 環境設定 --------
 DATA_FILE = "drafts.json"
 CONFIG_FILE = os.path.join(os.path.dirname(__file__), "config.json")
 BASE_URL = "https://draft-system-app-armvfexpppgyuyfb9vzbn6.streamlit.app"   # 実運用URLに書き換え可
+DRAFTS_CHECK_INTERVAL = 1.0   # 他レプリカの更新を確認する間隔（秒）
 
 # ---------------------------
 # JSON 読み書き
@@ -30,15 +33,44 @@ SUPABASE_URL = st.secrets["SUPABASE_URL"]
 SUPABASE_KEY = st.secrets["SUPABASE_KEY"]
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-# --- drafts.json 代替 ---
-def load_drafts():
-    res = supabase.table("drafts").select("data").eq("id", "main").execute()
-    if not res.data:
-        return {}
-    return res.data[0]["data"]
+# --- drafts.json 代替（複数レプリカ対応。リース・キャッシュはプロセスごとに1つ） ---
+@st.cache_resource
+def _coordination():
+    coord = SupabaseCoordinator(supabase)
+    store = SupabaseDraftsStore(supabase)
+    # キャッシュは省メモリな Draft で保持する（全セッションで共有）
+    def loader():
+        data, version = store.fetch()
+        return drafts_from_dict(data), version
+    return coord, store, VersionedCache(store.version, loader, check_interval=DRAFTS_CHECK_INTERVAL)
+
+coord, drafts_store, drafts_cache = _coordination()
 
-def save_drafts(d):
-    supabase.table("drafts").upsert({"id": "main", "data": d}).execute()
+# リースが取れない・保存が競合し続けたとき（画面には「混み合っています」と出す）
+BUSY_ERRORS = (LeaseBusy, WriteConflict)
+
+def load_drafts():
+    # 他レプリカで保存されていれば読み直す。セッションごとに新しい dict を作って返す
+    return drafts_to_dict(drafts_cache.get())
+
+def draft_lease(draft_id):
+    return f"draft:{draft_id}"
+
+def update_drafts(drafts, fn, lease_key=None):
+    """最新の drafts に fn を適用し、fn が True を返したら保存する。
+
+    全ドラフトを1行で保存しているため、変更は必ずここを通す。保存は version 列による
+    条件付き書き込みで、間に他の保存があれば読み直して fn をやり直す（リースの期限が
+    切れた後の古い書き込みも反映されない）。lease_key を渡すとその間リースを持つ。
+    呼び出し元の drafts も最新の内容に置き換える。
+    """
+    with coord.lease(lease_key) if lease_key else contextlib.nullcontext():
+        fresh, changed = drafts_store.update(fn)
+    if changed:
+        drafts_cache.invalidate()
+    drafts.clear()
+    drafts.update(fresh)
+    return changed
 
 # --- config.json 代替 ---
 def load_config():
@@ -100,17 +132,27 @@ def run_draft(votes, choices):
         if n not in assigned: assigned[n] = "-"
     return assigned
 
-def finalize_if_ready(drafts, draft_id):
-    """全員の投票が揃ったら抽選を実行し、結果ページに移行可能な状態にする"""
-    d = drafts[draft_id]
-    if d["status"] != "投票中":
+def _finalize(fresh, draft_id):
+    """fresh の draft_id が投票中で全員の投票が揃っていれば抽選して終了にする（update_drafts の中で使う）"""
+    d = fresh.get(draft_id)
+    if not d or d["status"] != "投票中":
         return False
-
     total = int(d.get("participants", 0))
     if total > 0 and len(d["votes"]) >= total:
         d["assigned"] = run_draft(d["votes"], d["choices"])
         d["status"] = "終了"
-        save_drafts(drafts)
+        return True
+    return False
+
+def finalize_if_ready(drafts, draft_id):
+    """全員の投票が揃ったら抽選を実行し、結果ページに移行可能な状態にする"""
+    try:
+        # 状態はリース内で読み直した最新データで判定する（抽選は1回だけ）
+        done = update_drafts(drafts, lambda fresh: _finalize(fresh, draft_id), draft_lease(draft_id))
+    except BUSY_ERRORS:
+        # 他レプリカが処理中。次に投票ページを開いたときに再判定される
+        return False
+    if done:
         st.session_state["page"] = "結果"
         st.session_state["draft_id"] = draft_id
         return True
@@ -242,6 +284,10 @@ elif page=="投票":
             st.session_state["page"]="中止"
             st.query_params.update({"page": "中止", "draft_id": draft_id})
             st.rerun()
+        elif 0 < int(d.get("participants", 0)) <= len(d["votes"]) and finalize_if_ready(drafts, draft_id):
+            # 最後の投票を受けたレプリカが抽選前に落ちた場合もここで確定させる
+            st.query_params.update({"page": "結果", "draft_id": draft_id})
+            st.rerun()
         else:
             st.title(f"投票: {d['title']}")
             if not st.session_state.get("voter_name"):
@@ -271,11 +317,26 @@ elif page=="投票":
                     st.warning("⚠ すべての順位を選んでから投票してください")
 
                 if st.button("投票する", disabled=not all_filled):
-                    d["votes"][name] = rankings
-                    save_drafts(drafts)
+                    def _vote(fresh):
+                        if fresh.get(draft_id, {}).get("status") != "投票中":
+                            return False
+                        fresh[draft_id]["votes"][name] = rankings
+                        # 最後の1票なら同じ書き込みで抽選まで済ませる
+                        _finalize(fresh, draft_id)
+                        return True
+                    try:
+                        accepted = update_drafts(drafts, _vote, draft_lease(draft_id))
+                    except BUSY_ERRORS:
+                        st.error("混み合っています。もう一度投票してください。")
+                        st.stop()
+                    if not accepted:
+                        # 他レプリカで抽選・中止済み。再描画で結果／中止ページへ移動する
+                        st.error("このドラフトは既に締め切られたため、投票は反映されませんでした。")
+                        time.sleep(1.5)
+                        st.rerun()
                     st.success("投票しました（再投票時は上書きされます）")
 
-                    if finalize_if_ready(drafts, draft_id):
+                    if drafts[draft_id]["status"] == "終了":
                         st.success("全員の投票が完了しました！結果ページに移動します...")
                         st.session_state["page"] = "結果"
                         st.session_state["draft_id"] = draft_id
@@ -367,8 +428,7 @@ elif page=="管理者":
             elif len(valid_choices) != len(set(valid_choices)):
                 st.error("選択肢が重複しています。同じ名前は使用できません。")
             else:
-                draft_id=str(len(drafts)+1)
-                drafts[draft_id]={ 
+                new_draft={ 
                     "title":sanitize_title(title),
                     "date":datetime.datetime.now().strftime("%Y-%m-%d %H:%M"),
                     "status":"投票中",
@@ -378,7 +438,18 @@ elif page=="管理者":
                     "assigned":{},
                     "created_by": st.session_state["username"]
                 }
-                save_drafts(drafts)
+                created = {}
+                def _create(fresh):
+                    # ID は最新データで採番する（他レプリカと重複しないように）
+                    created["id"] = str(len(fresh)+1)
+                    fresh[created["id"]] = new_draft
+                    return True
+                try:
+                    update_drafts(drafts, _create)
+                except BUSY_ERRORS:
+                    st.error("混み合っています。もう一度お試しください。")
+                    st.stop()
+                draft_id = created["id"]
                 vote_url=f"{BASE_URL}/?page=投票&draft_id={draft_id}"
                 st.success("ドラフト作成！")
                 st.markdown(f'<a href="{vote_url}" target="_self">このドラフトの投票ページはこちら</a>', unsafe_allow_html=True)
@@ -398,8 +469,20 @@ elif page=="管理者":
                     col1, col2 = st.columns(2)
                     with col1:
                         if st.button("✅ 本当に中止する", key=f"do_cancel_{draft_id}"):
-                            d["status"] = "中止"
-                            save_drafts(drafts)
+                            def _cancel(fresh, draft_id=draft_id):
+                                # 他レプリカで抽選済みなら中止しない
+                                if fresh.get(draft_id, {}).get("status") != "投票中":
+                                    return False
+                                fresh[draft_id]["status"] = "中止"
+                                return True
+                            try:
+                                cancelled = update_drafts(drafts, _cancel, draft_lease(draft_id))
+                            except BUSY_ERRORS:
+                                st.error("混み合っています。もう一度お試しください。")
+                                st.stop()
+                            if not cancelled:
+                                st.error("このドラフトは既に終了しています。")
+                                st.stop()
                             st.success(f"「{d['title']}」を中止しました。")
                             st.session_state["page"] = "中止"
                             st.session_state["draft_id"] = draft_id
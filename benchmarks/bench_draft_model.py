@@ -0,0 +1,71 @@
+"""app.py の drafts キャッシュ: dict のまま保持する場合と draft_model で保持する場合の比較
+
+    python benchmarks/bench_draft_model.py [ドラフト数] [参加人数] [選択肢数]
+
+  memory   … キャッシュに保持している間のメモリ量
+  build    … 取得した JSON からキャッシュを作る時間（dict: なし / draft_model: drafts_from_dict）
+  per-run  … 再描画ごとにセッション用の dict を作る時間（dict: deepcopy / draft_model: drafts_to_dict）
+"""
+import copy, json, os, random, sys, time, tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import draft_model
+
+
+def make_history(n_drafts, n_voters, n_choices):
+    drafts = {}
+    for k in range(1, n_drafts + 1):
+        choices = [f"選択肢{k}-{i}" for i in range(n_choices)]
+        votes = {}
+        for v in range(n_voters):
+            order = random.sample(choices, n_choices)
+            votes[f"参加者{v}"] = {f"{i}位": c for i, c in enumerate(order, 1)}
+        drafts[str(k)] = {
+            "title": f"ドラフト{k}", "date": "2025-10-04 14:15", "status": "終了",
+            "participants": n_voters, "choices": choices, "votes": votes,
+            "assigned": {n: random.choice(choices) for n in votes},
+            "created_by": "admin",
+        }
+    return drafts
+
+
+def timeit(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter(); fn(); best = min(best, time.perf_counter() - t)
+    return best
+
+
+def retained_memory(fn):
+    """fn の戻り値を保持している間に確保されているメモリ量"""
+    tracemalloc.start()
+    obj = fn()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del obj
+    return size
+
+
+def main():
+    n_drafts, n_voters, n_choices = (int(a) for a in (sys.argv[1:] + ["300", "30", "20"][len(sys.argv) - 1:]))
+    random.seed(0)
+    text = json.dumps(make_history(n_drafts, n_voters, n_choices), ensure_ascii=False)
+    data = json.loads(text)
+    typed = draft_model.drafts_from_dict(data)
+    assert draft_model.drafts_to_dict(typed) == data
+
+    mem_dict = retained_memory(lambda: json.loads(text))
+    mem_typed = retained_memory(lambda: draft_model.drafts_from_dict(json.loads(text)))
+    build = timeit(lambda: draft_model.drafts_from_dict(data))
+    per_run_dict = timeit(lambda: copy.deepcopy(data))
+    per_run_typed = timeit(lambda: draft_model.drafts_to_dict(typed))
+
+    print(f"{n_drafts} drafts x {n_voters} voters x {n_choices} choices")
+    print(f"{'':8}{'dict':>10}{'draft_model':>14}")
+    print(f"{'memory':8}{mem_dict / 2**20:8.1f}MB{mem_typed / 2**20:12.1f}MB")
+    print(f"{'build':8}{0:8.1f}ms{build * 1e3:12.1f}ms")
+    print(f"{'per-run':8}{per_run_dict * 1e3:8.1f}ms{per_run_typed * 1e3:12.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""複数レプリカ間の調整（リース・条件付き書き込み・キャッシュ無効化）
+
+Streamlit を複数プロセスで動かしても、
+  * 抽選（finalize）や中止などの読み込み→変更→保存 が同時に 1 つだけ実行される
+  * どのレプリカに振り分けられても最新の drafts が見える
+ようにするための仕組み。drafts はすべて共有ストアに置くが、ログイン状態などの
+st.session_state は WebSocket を持つプロセスにあるため、ロードバランサ側で
+WebSocket 接続のアフィニティ（同じ接続は同じレプリカへ）は必要。
+
+  Coordinator  … キーごとのリース。期限の判定は DB の時計で行う
+  DraftsStore  … drafts 行の読み書き。version 列による比較交換（CAS）で保存するので、
+                 リースの期限が切れた後の古い書き込みは WriteConflict になり反映されない
+
+バックエンド:
+  Supabase*  … 本番用（テーブルと関数は sql/coordination.sql）
+  Sqlite*    … ローカル／テスト用。同一ホストの複数プロセスで共有できる
+"""
+import abc
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+DEFAULT_TTL = 15.0
+
+
+class LeaseBusy(Exception):
+    """リースを取得できなかった（他のセッション・レプリカが処理中）"""
+
+
+class WriteConflict(Exception):
+    """保存しようとした間に drafts 行が他から更新された"""
+
+
+# ---------------------------
+# リース
+# ---------------------------
+class Coordinator(abc.ABC):
+    """リースの共通部分。
+
+    リースは取得ごとに一意なトークンで持つので、同じプロセス内の別セッション
+    （Streamlit のスレッド）同士でも排他になる。期限はバックエンドの DB 時計で判定する。
+    """
+
+    def __init__(self, holder=None):
+        # レプリカ（プロセス）ごとの ID。トークンの接頭辞としてデバッグ用に使う
+        self.holder = holder or f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    def acquire(self, key, ttl=DEFAULT_TTL):
+        """リースを取得できればトークン、できなければ None を返す。期限切れのリースは奪い取る"""
+        token = f"{self.holder}:{uuid.uuid4().hex}"
+        return token if self._try_acquire(key, token, ttl) else None
+
+    def release(self, key, token):
+        """token で取得したリースを解放する。他の取得者のリースには影響しない"""
+        self._release(key, token)
+
+    @contextlib.contextmanager
+    def lease(self, key, ttl=DEFAULT_TTL, wait=5.0, interval=0.1):
+        """with coord.lease("draft:1"): ... の形で使う。wait 秒以内に取れなければ LeaseBusy"""
+        deadline = time.monotonic() + wait
+        while (token := self.acquire(key, ttl)) is None:
+            if time.monotonic() >= deadline:
+                raise LeaseBusy(key)
+            time.sleep(interval)
+        try:
+            yield token
+        finally:
+            self.release(key, token)
+
+    @abc.abstractmethod
+    def _try_acquire(self, key, token, ttl):
+        """key が空いているか期限切れなら token で取得して True を返す"""
+
+    @abc.abstractmethod
+    def _release(self, key, token):
+        """key が token で保持されていれば削除する"""
+
+
+# ---------------------------
+# drafts 行
+# ---------------------------
+class DraftsStore(abc.ABC):
+    """drafts を 1 行（data と version）として読み書きする"""
+
+    def update(self, fn, retries=5):
+        """最新の drafts に fn を適用し、fn が True を返したら条件付きで保存する。
+
+        保存までの間に他から更新されていたら読み直して fn をやり直す。
+        (drafts, 保存したか) を返し、retries 回続けて競合したら WriteConflict。
+        """
+        for _ in range(retries):
+            data, version = self.fetch()
+            if not fn(data):
+                return data, False
+            try:
+                self.save(data, version)
+            except WriteConflict:
+                continue
+            return data, True
+        raise WriteConflict("drafts")
+
+    @abc.abstractmethod
+    def fetch(self):
+        """(drafts, version) を返す。行が無ければ ({}, None)"""
+
+    @abc.abstractmethod
+    def version(self):
+        """現在の version（行が無ければ None）"""
+
+    @abc.abstractmethod
+    def save(self, data, expected):
+        """version が expected のときだけ保存して新しい version を返す。違えば WriteConflict"""
+
+
+# ---------------------------
+# Supabase（Postgres）
+# ---------------------------
+class SupabaseCoordinator(Coordinator):
+    def __init__(self, client, holder=None):
+        super().__init__(holder)
+        self.client = client
+
+    def _try_acquire(self, key, token, ttl):
+        # 期限の計算・判定は DB 側の now() で行う（レプリカ間の時計のずれの影響を受けない）
+        res = self.client.rpc("try_acquire_lease",
+                              {"p_key": key, "p_holder": token, "p_ttl": ttl}).execute()
+        return res.data is True
+
+    def _release(self, key, token):
+        self.client.table("leases").delete().eq("key", key).eq("holder", token).execute()
+
+
+class SupabaseDraftsStore(DraftsStore):
+    def __init__(self, client, row_id="main"):
+        self.client = client
+        self.row_id = row_id
+
+    def fetch(self):
+        res = self.client.table("drafts").select("data, version").eq("id", self.row_id).execute()
+        if not res.data:
+            return {}, None
+        return res.data[0]["data"], res.data[0]["version"]
+
+    def version(self):
+        res = self.client.table("drafts").select("version").eq("id", self.row_id).execute()
+        return res.data[0]["version"] if res.data else None
+
+    def save(self, data, expected):
+        drafts = self.client.table("drafts")
+        new = uuid.uuid4().hex
+        row = {"id": self.row_id, "data": data, "version": new}
+        if expected is None:
+            # 行が無い場合だけ挿入。既にあれば data は空で返る
+            res = drafts.upsert(row, on_conflict="id", ignore_duplicates=True).execute()
+        else:
+            # 更新された行だけが返るので、空なら他が先に保存している
+            res = drafts.update(row).eq("id", self.row_id).eq("version", expected).execute()
+        if not res.data:
+            raise WriteConflict(self.row_id)
+        return new
+
+
+# ---------------------------
+# SQLite（ローカル・テスト用）
+# ---------------------------
+# SQLite の現在時刻（UNIX 秒）
+_SQLITE_NOW = "((julianday('now') - 2440587.5) * 86400.0)"
+
+
+@contextlib.contextmanager
+def _sqlite_tx(path):
+    # 接続は操作ごとに開くので、スレッド・プロセスをまたいで使える
+    con = sqlite3.connect(path, timeout=10, isolation_level=None)
+    try:
+        # BEGIN IMMEDIATE で書き込みロックを取り、判定と更新を不可分にする
+        con.execute("begin immediate")
+        yield con
+        con.execute("commit")
+    except BaseException:
+        con.execute("rollback")
+        raise
+    finally:
+        con.close()
+
+
+class SqliteCoordinator(Coordinator):
+    def __init__(self, path, holder=None):
+        super().__init__(holder)
+        self.path = path
+        with _sqlite_tx(path) as con:
+            con.execute("create table if not exists leases"
+                        " (key text primary key, holder text not null, expires_at real not null)")
+
+    def _try_acquire(self, key, token, ttl):
+        with _sqlite_tx(self.path) as con:
+            cur = con.execute(
+                f"insert into leases (key, holder, expires_at) values (?, ?, {_SQLITE_NOW} + ?)"
+                " on conflict(key) do update set holder = excluded.holder, expires_at = excluded.expires_at"
+                f" where leases.expires_at < {_SQLITE_NOW}",
+                (key, token, ttl))
+            return cur.rowcount == 1
+
+    def _release(self, key, token):
+        with _sqlite_tx(self.path) as con:
+            con.execute("delete from leases where key = ? and holder = ?", (key, token))
+
+
+class SqliteDraftsStore(DraftsStore):
+    def __init__(self, path, row_id="main"):
+        self.path = path
+        self.row_id = row_id
+        with _sqlite_tx(path) as con:
+            con.execute("create table if not exists drafts"
+                        " (id text primary key, data text not null, version text not null)")
+
+    def fetch(self):
+        with _sqlite_tx(self.path) as con:
+            row = con.execute("select data, version from drafts where id = ?", (self.row_id,)).fetchone()
+        return (json.loads(row[0]), row[1]) if row else ({}, None)
+
+    def version(self):
+        with _sqlite_tx(self.path) as con:
+            row = con.execute("select version from drafts where id = ?", (self.row_id,)).fetchone()
+        return row[0] if row else None
+
+    def save(self, data, expected):
+        new = uuid.uuid4().hex
+        text = json.dumps(data, ensure_ascii=False)
+        with _sqlite_tx(self.path) as con:
+            if expected is None:
+                cur = con.execute("insert or ignore into drafts (id, data, version) values (?, ?, ?)",
+                                  (self.row_id, text, new))
+            else:
+                cur = con.execute("update drafts set data = ?, version = ? where id = ? and version = ?",
+                                  (text, new, self.row_id, expected))
+        if cur.rowcount != 1:
+            raise WriteConflict(self.row_id)
+        return new
+
+
+# ---------------------------
+# バージョン付きキャッシュ
+# ---------------------------
+class VersionedCache:
+    """共有の version が変わったときだけ loader を呼び直すプロセス内キャッシュ。
+
+    version_fn() は現在の version、loader() は (値, その値の version) を返す。
+    version の確認も共有ストアへの問い合わせなので、check_interval 秒以内の get() は
+    確認を省いて手元の値を返す（他レプリカの更新は最大 check_interval 秒遅れて見える）。
+    """
+
+    def __init__(self, version_fn, loader, check_interval=0.0):
+        self.version_fn, self.loader = version_fn, loader
+        self.check_interval = check_interval
+        self._version = self._value = None
+        self._loaded = False
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._loaded and now - self._checked_at < self.check_interval:
+                return self._value
+            if not self._loaded or self.version_fn() != self._version:
+                self._value, self._version = self.loader()
+                self._loaded = True
+            self._checked_at = now
+            return self._value
+
+    def invalidate(self):
+        """このプロセスで保存した後に呼ぶ。次の get() で読み直す"""
+        with self._lock:
+            self._loaded = False
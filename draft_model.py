@@ -0,0 +1,152 @@
+"""ドラフトの型付きメモリ表現（省メモリ）
+
+app.py のプロセス内キャッシュは drafts をこの形で保持し、各セッションには
+drafts_to_dict() で作った dict を渡す。保存形式（drafts.json / Supabase の JSON）は変えない。
+投票は「選択肢インデックスの配列」として持つので、保持時のメモリ量が dict の数分の一になる。
+"""
+from array import array
+
+RANK_FMT = "{}位"
+
+
+_RANKS = []
+
+
+def rank_labels(n):
+    """("1位", ..., "n位") を返す（生成済みのラベルを使い回す）"""
+    while len(_RANKS) < n:
+        _RANKS.append(RANK_FMT.format(len(_RANKS) + 1))
+    return _RANKS[:n]
+
+
+# ---------------------------
+# 投票（1人分）
+# ---------------------------
+class Ballot:
+    """1人分の投票。picks[i] は (i+1)位 に選んだ選択肢のインデックス"""
+    __slots__ = ("picks",)
+
+    def __init__(self, picks):
+        self.picks = picks if isinstance(picks, array) else array("H", picks)
+
+    @classmethod
+    def from_dict(cls, vote, index):
+        """{"1位": "a", ...} から生成する。index は 選択肢 → インデックス の辞書"""
+        ranks = rank_labels(len(vote))
+        return cls(array("H", map(index.__getitem__, map(vote.__getitem__, ranks))))
+
+    def to_dict(self, labels):
+        return dict(zip(rank_labels(len(self.picks)), map(labels.__getitem__, self.picks)))
+
+    def __eq__(self, other):
+        return isinstance(other, Ballot) and self.picks == other.picks
+
+    def __repr__(self):
+        return f"Ballot({list(self.picks)!r})"
+
+
+# ---------------------------
+# ドラフト
+# ---------------------------
+class Draft:
+    """1件のドラフト。
+
+    labels は choices の後ろに、投票・割当にだけ現れる文字列
+    （選択肢を後から消した古いデータ、割当の "-" など）を追加したもの。
+    choices は labels[:n_choices] として復元する。
+    """
+    __slots__ = ("title", "date", "status", "participants", "labels",
+                 "n_choices", "voters", "ballots", "assigned", "extra", "absent")
+
+    def __init__(self, title, date, status, participants, choices,
+                 voters=(), ballots=(), assigned=None, extra=None):
+        self.title = title
+        self.date = date
+        self.status = status
+        self.participants = participants
+        self.labels = list(choices)
+        self.n_choices = len(self.labels)
+        self.voters = list(voters)
+        self.ballots = list(ballots)
+        # assigned は 名前 → labels のインデックス
+        self.assigned = assigned if assigned is not None else {}
+        # created_by など既知以外のキーはそのまま保持する
+        self.extra = extra if extra is not None else {}
+        # 元データに無かった既知のキー（to_dict で出力しない）
+        self.absent = ()
+
+    @property
+    def choices(self):
+        return self.labels[:self.n_choices]
+
+    def _index(self):
+        return {c: i for i, c in enumerate(self.labels)}
+
+    def _intern(self, index, label):
+        i = index.get(label)
+        if i is None:
+            i = index[label] = len(self.labels)
+            self.labels.append(label)
+        return i
+
+    # ---- 変換 ----
+    @classmethod
+    def from_dict(cls, d):
+        extra = {k: v for k, v in d.items() if k not in _DRAFT_KEYS}
+        draft = cls(d.get("title", ""), d.get("date", ""), d.get("status", ""),
+                    d.get("participants", 0), d.get("choices", []), extra=extra)
+        index = draft._index()
+        votes = d.get("votes") or {}
+        draft.voters = list(votes)
+        try:
+            draft.ballots = [Ballot.from_dict(v, index) for v in votes.values()]
+        except KeyError:
+            # 順位キーを確認し、choices にない文字列を含む古いデータだけ labels に追加してやり直す
+            for name, vote in votes.items():
+                if set(vote) != set(rank_labels(len(vote))):
+                    raise ValueError(f"{name} の投票の順位が 1位〜{len(vote)}位 になっていません: {list(vote)}")
+                for label in vote.values():
+                    draft._intern(index, label)
+            draft.ballots = [Ballot.from_dict(v, index) for v in votes.values()]
+        draft.assigned = {n: draft._intern(index, c)
+                          for n, c in (d.get("assigned") or {}).items()}
+        if len(d) - len(extra) < len(_DRAFT_KEYS):
+            draft.absent = tuple(k for k in _DRAFT_KEYS if k not in d)
+        return draft
+
+    def to_dict(self):
+        labels = self.labels
+        d = {
+            "title": self.title,
+            "date": self.date,
+            "status": self.status,
+            "participants": self.participants,
+            "choices": labels[:self.n_choices],
+            "votes": {n: b.to_dict(labels) for n, b in zip(self.voters, self.ballots)},
+            "assigned": {n: labels[i] for n, i in self.assigned.items()},
+        }
+        for k in self.absent:
+            del d[k]
+        d.update(self.extra)
+        return d
+
+    def __repr__(self):
+        return f"Draft({self.title!r}, {self.status!r}, votes={len(self.ballots)})"
+
+
+_DRAFT_KEYS = frozenset(("title", "date", "status", "participants",
+                         "choices", "votes", "assigned"))
+
+
+# ---------------------------
+# 変換
+# ---------------------------
+def drafts_from_dict(data):
+    """{draft_id: dict} → {draft_id: Draft}"""
+    return {k: Draft.from_dict(v) for k, v in data.items()}
+
+
+def drafts_to_dict(drafts):
+    """{draft_id: Draft} → {draft_id: dict}（Supabase の upsert にそのまま渡せる形）"""
+    return {k: v.to_dict() for k, v in drafts.items()}
+
@@ -0,0 +1,34 @@
+-- 複数レプリカ対応（coordination.py）で使うテーブルと関数
+-- app.py を起動する前に Supabase の SQL Editor で実行する
+
+-- drafts 行の version: 保存のたびに新しい値にし、version が変わっていない場合だけ保存する（CAS）。
+-- 他レプリカはこの列だけを読んでキャッシュが古いかを判定する
+alter table drafts add column if not exists version text not null default '';
+
+-- リース: key ごとに 1 行。holder は取得ごとのトークン
+create table if not exists leases (
+    key        text primary key,
+    holder     text not null,
+    expires_at timestamptz not null
+);
+
+-- リースの取得。期限は DB の now() で計算・判定するので、レプリカ間の時計のずれの影響を受けない
+create or replace function try_acquire_lease(p_key text, p_holder text, p_ttl double precision)
+returns boolean
+language plpgsql
+as $$
+declare
+    acquired boolean;
+begin
+    insert into leases (key, holder, expires_at)
+    values (p_key, p_holder, now() + make_interval(secs => p_ttl))
+    on conflict (key) do update
+        set holder = excluded.holder, expires_at = excluded.expires_at
+        where leases.expires_at < now()
+    returning true into acquired;
+    return coalesce(acquired, false);
+end;
+$$;
+
+-- 以前の版で作成したバージョン管理用テーブル（drafts.version に統合）
+drop table if exists versions;
@@ -0,0 +1,305 @@
+import multiprocessing
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from coordination import (Coordinator, DraftsStore, LeaseBusy, SqliteCoordinator, SqliteDraftsStore,
+                          SupabaseCoordinator, SupabaseDraftsStore, VersionedCache, WriteConflict)
+
+
+# ---------------------------
+# リース（SQLite）
+# ---------------------------
+def _count_inside(coord, key, counter, lock, n):
+    for _ in range(n):
+        with coord.lease(key, wait=30, interval=0.001):
+            with lock:
+                counter["inside"] += 1
+                counter["max"] = max(counter["max"], counter["inside"])
+            time.sleep(0.001)
+            with lock:
+                counter["inside"] -= 1
+
+
+def test_lease_excludes_threads_sharing_one_coordinator(tmp_path):
+    # Streamlit のセッションは同じプロセス内のスレッドで coordinator を共有する
+    coord = SqliteCoordinator(str(tmp_path / "c.db"))
+    counter, lock = {"inside": 0, "max": 0}, threading.Lock()
+    threads = [threading.Thread(target=_count_inside, args=(coord, "drafts", counter, lock, 10))
+               for _ in range(8)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert counter["max"] == 1
+
+
+def test_acquire_twice_from_same_coordinator_fails(tmp_path):
+    coord = SqliteCoordinator(str(tmp_path / "c.db"))
+    assert coord.acquire("drafts") is not None
+    assert coord.acquire("drafts") is None
+    assert coord.acquire("other") is not None
+
+
+def _increment(path, state, n):
+    coord = SqliteCoordinator(path)
+    for _ in range(n):
+        with coord.lease("drafts", wait=30, interval=0.001):
+            value = int(state.read_text())
+            time.sleep(0.001)
+            state.write_text(str(value + 1))
+
+
+def test_lease_excludes_processes(tmp_path):
+    path, state = str(tmp_path / "c.db"), tmp_path / "state"
+    state.write_text("0")
+    SqliteCoordinator(path)
+    procs = [multiprocessing.Process(target=_increment, args=(path, state, 10)) for _ in range(4)]
+    for p in procs: p.start()
+    for p in procs: p.join()
+    assert all(p.exitcode == 0 for p in procs)
+    assert state.read_text() == "40"
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    a = SqliteCoordinator(str(tmp_path / "c.db"), holder="a")
+    b = SqliteCoordinator(str(tmp_path / "c.db"), holder="b")
+    assert a.acquire("drafts", ttl=0.05) is not None
+    assert b.acquire("drafts") is None
+    time.sleep(0.1)
+    assert b.acquire("drafts") is not None
+
+
+def test_lease_busy_after_wait(tmp_path):
+    a = SqliteCoordinator(str(tmp_path / "c.db"))
+    b = SqliteCoordinator(str(tmp_path / "c.db"))
+    a.acquire("drafts")
+    start = time.monotonic()
+    with pytest.raises(LeaseBusy):
+        with b.lease("drafts", wait=0.1, interval=0.01):
+            pass
+    assert time.monotonic() - start < 1
+
+
+def test_release_by_non_holder_is_noop(tmp_path):
+    a = SqliteCoordinator(str(tmp_path / "c.db"))
+    b = SqliteCoordinator(str(tmp_path / "c.db"))
+    token = a.acquire("drafts")
+    b.release("drafts", "someone-else")
+    a.release("drafts", "stale-token")
+    assert b.acquire("drafts") is None
+    a.release("drafts", token)
+    assert b.acquire("drafts") is not None
+
+
+def test_base_classes_are_abstract():
+    with pytest.raises(TypeError):
+        Coordinator()
+    with pytest.raises(TypeError):
+        DraftsStore()
+
+
+# ---------------------------
+# drafts 行（SQLite）
+# ---------------------------
+def test_store_save_requires_expected_version(tmp_path):
+    store = SqliteDraftsStore(str(tmp_path / "c.db"))
+    assert store.fetch() == ({}, None)
+    v1 = store.save({"1": {}}, None)
+    with pytest.raises(WriteConflict):
+        store.save({"2": {}}, None)
+    with pytest.raises(WriteConflict):
+        store.save({"2": {}}, "stale")
+    v2 = store.save({"2": {}}, v1)
+    assert store.fetch() == ({"2": {}}, v2)
+    assert store.version() == v2
+
+
+def test_store_update_retries_on_conflict(tmp_path):
+    path = str(tmp_path / "c.db")
+    store, other = SqliteDraftsStore(path), SqliteDraftsStore(path)
+    store.save({"n": 0}, None)
+    calls = []
+
+    def fn(data):
+        calls.append(data["n"])
+        if len(calls) == 1:
+            # fn の途中で他が保存した
+            d, v = other.fetch()
+            other.save({"n": d["n"] + 10}, v)
+        data["n"] += 1
+        return True
+
+    data, changed = store.update(fn)
+    assert changed and calls == [0, 10]
+    assert store.fetch()[0] == {"n": 11}
+
+
+def test_store_update_gives_up_after_retries(tmp_path):
+    path = str(tmp_path / "c.db")
+    store, other = SqliteDraftsStore(path), SqliteDraftsStore(path)
+    store.save({"n": 0}, None)
+
+    def fn(data):
+        d, v = other.fetch()
+        other.save(d, v)
+        return True
+
+    with pytest.raises(WriteConflict):
+        store.update(fn, retries=3)
+
+
+def _add_votes(path, worker, n):
+    store = SqliteDraftsStore(path)
+
+    def fn(data):
+        data["votes"].append(f"{worker}-{i}")
+        return True
+
+    for i in range(n):
+        store.update(fn, retries=1000)
+
+
+def test_store_update_loses_no_writes_across_processes(tmp_path):
+    # リースなしで同じ行に書いても、CAS で全ての更新が残る
+    path = str(tmp_path / "c.db")
+    SqliteDraftsStore(path).save({"votes": []}, None)
+    procs = [multiprocessing.Process(target=_add_votes, args=(path, w, 10)) for w in range(4)]
+    for p in procs: p.start()
+    for p in procs: p.join()
+    assert all(p.exitcode == 0 for p in procs)
+    assert len(SqliteDraftsStore(path).fetch()[0]["votes"]) == 40
+
+
+def test_write_after_lease_expired_is_rejected(tmp_path):
+    # リース期限切れ後に奪われた場合、元の保持者の古い書き込みは反映されない
+    path = str(tmp_path / "c.db")
+    slow, fast = SqliteCoordinator(path), SqliteCoordinator(path)
+    store = SqliteDraftsStore(path)
+    store.save({"status": "投票中"}, None)
+
+    assert slow.acquire("draft:1", ttl=0.05) is not None
+    stale, version = store.fetch()
+    time.sleep(0.1)
+    with fast.lease("draft:1"):
+        store.update(lambda d: d.update(status="中止") or True)
+    stale["status"] = "終了"
+    with pytest.raises(WriteConflict):
+        store.save(stale, version)
+    assert store.fetch()[0] == {"status": "中止"}
+
+
+# ---------------------------
+# バージョン付きキャッシュ
+# ---------------------------
+def _cache(store, loads, **kw):
+    def loader():
+        data, version = store.fetch()
+        loads.append(1)
+        return data, version
+    return VersionedCache(store.version, loader, **kw)
+
+
+def test_versioned_cache_reloads_after_other_save(tmp_path):
+    path = str(tmp_path / "c.db")
+    loads = []
+    cache = _cache(SqliteDraftsStore(path), loads)
+    assert cache.get() == {}
+    assert cache.get() == {}
+    assert len(loads) == 1  # 行が無い（version が None）ままなら読み直さない
+    other = SqliteDraftsStore(path)
+    other.save({"1": {}}, None)
+    assert cache.get() == {"1": {}}
+    assert cache.get() == {"1": {}}
+    assert len(loads) == 2
+
+
+def test_versioned_cache_check_interval_skips_version_query(tmp_path):
+    path = str(tmp_path / "c.db")
+    store, loads = SqliteDraftsStore(path), []
+    cache = _cache(store, loads, check_interval=60)
+    assert cache.get() == {}
+    SqliteDraftsStore(path).save({"1": {}}, None)
+    assert cache.get() == {}
+    cache.invalidate()
+    assert cache.get() == {"1": {}}
+
+
+# ---------------------------
+# Supabase（偽クライアント）
+# ---------------------------
+class FakeQuery:
+    def __init__(self, client, table):
+        self.client, self.calls = client, [("table", table)]
+
+    def __getattr__(self, name):
+        def method(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return method
+
+    def execute(self):
+        self.client.queries.append(self.calls)
+        return SimpleNamespace(data=self.client.results.pop(0))
+
+
+class FakeClient:
+    def __init__(self, *results):
+        self.results, self.queries = list(results), []
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params):
+        q = FakeQuery(self, None)
+        q.calls = [("rpc", name, params)]
+        return q
+
+
+def test_supabase_lease_uses_rpc_result():
+    client = FakeClient(True, False)
+    coord = SupabaseCoordinator(client, holder="r1")
+    token = coord.acquire("draft:1", ttl=3)
+    assert token.startswith("r1:")
+    assert coord.acquire("draft:1") is None
+    name, params = client.queries[0][0][1:]
+    assert name == "try_acquire_lease"
+    assert params == {"p_key": "draft:1", "p_holder": token, "p_ttl": 3}
+
+
+def test_supabase_release_matches_token():
+    client = FakeClient([])
+    SupabaseCoordinator(client).release("draft:1", "tok")
+    calls = client.queries[0]
+    assert ("eq", ("key", "draft:1"), {}) in calls and ("eq", ("holder", "tok"), {}) in calls
+
+
+def test_supabase_store_insert_conflict_when_upsert_returns_empty():
+    # ignore_duplicates の upsert は既存行があると空の data を返す
+    client = FakeClient([{"id": "main"}], [])
+    store = SupabaseDraftsStore(client)
+    assert store.save({}, None)
+    with pytest.raises(WriteConflict):
+        store.save({}, None)
+    name, _, kwargs = client.queries[1][1]
+    assert name == "upsert" and kwargs == {"on_conflict": "id", "ignore_duplicates": True}
+
+
+def test_supabase_store_update_is_conditional_on_version():
+    # 条件付き update は更新した行だけを返す。空なら他が先に保存している
+    client = FakeClient([{"id": "main"}], [])
+    store = SupabaseDraftsStore(client)
+    new = store.save({"1": {}}, "v1")
+    calls = client.queries[0]
+    assert calls[1][0] == "update" and calls[1][1][0]["version"] == new
+    assert ("eq", ("version", "v1"), {}) in calls
+    with pytest.raises(WriteConflict):
+        store.save({"1": {}}, "v1")
+
+
+def test_supabase_store_fetch():
+    client = FakeClient([], [{"data": {"1": {}}, "version": "v"}], [{"version": "v"}])
+    store = SupabaseDraftsStore(client)
+    assert store.fetch() == ({}, None)
+    assert store.fetch() == ({"1": {}}, "v")
+    assert store.version() == "v"
@@ -0,0 +1,52 @@
+import json
+import os
+
+import pytest
+
+import draft_model
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _draft(**kw):
+    d = {"title": "t", "date": "2025-10-04 14:15", "status": "投票中", "participants": 2,
+         "choices": ["a", "b", "c"], "votes": {}, "assigned": {}}
+    d.update(kw)
+    return d
+
+
+def test_roundtrip_committed_drafts_json():
+    with open(os.path.join(ROOT, "drafts.json"), encoding="utf-8") as f:
+        data = json.load(f)
+    typed = draft_model.drafts_from_dict(data)
+    assert draft_model.drafts_to_dict(typed) == data
+
+
+def test_ballots_are_choice_indices():
+    d = draft_model.Draft.from_dict(_draft(votes={"x": {"1位": "c", "2位": "a", "3位": "b"}}))
+    assert list(d.ballots[0].picks) == [2, 0, 1]
+
+
+def test_labels_outside_choices_and_extra_keys_are_kept():
+    data = _draft(votes={"x": {"1位": "z", "2位": "a"}}, assigned={"x": "-"}, created_by="admin")
+    d = draft_model.Draft.from_dict(data)
+    assert d.choices == ["a", "b", "c"]
+    assert d.to_dict() == data
+
+
+def test_sparse_rank_keys_raise_clear_error():
+    with pytest.raises(ValueError, match="x"):
+        draft_model.Draft.from_dict(_draft(votes={"x": {"1位": "a", "3位": "c"}}))
+
+
+def test_missing_keys_are_not_added_back():
+    data = {"title": "t", "status": "中止", "choices": ["a"], "created_by": "admin"}
+    assert draft_model.Draft.from_dict(data).to_dict() == data
+
+
+def test_to_dict_returns_fresh_objects():
+    typed = draft_model.Draft.from_dict(_draft(votes={"x": {"1位": "a", "2位": "b", "3位": "c"}}))
+    first = typed.to_dict()
+    first["votes"]["y"] = {}
+    first["choices"].append("d")
+    assert typed.to_dict() == _draft(votes={"x": {"1位": "a", "2位": "b", "3位": "c"}})